@@ -1,97 +1,234 @@
+import array
+import concurrent.futures
 import functools
+import itertools
+import os
 import pathlib
+import pickle
+import re
 import subprocess
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+from coverage.exceptions import CoverageException
+from coverage.misc import Hasher
 
-def parse_range_info(range_info):
-    if range_info[0] in ("+", "-"):
-        range_info = range_info[1:]
-    if "0,0" == range_info:
-        start, size = 1, 1
-    elif "," in range_info:
-        start, size = map(int, range_info.split(","))
+# Columns of the blocks of a file: (base_starts, curr_starts, sizes)
+UnchangedBlocks = Tuple["array.array[int]", "array.array[int]", "array.array[int]"]
+
+# Hunk header of a git diff, where a missing size means a single line
+HUNK_RE = re.compile(rb"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# Bump this when the format of the cached unchanged blocks changes.
+CACHE_VERSION = 2
+
+
+def count_lines(content: bytes) -> int:
+    """Count the lines of a file content like git does, without decoding it."""
+    n_lines = content.count(b"\n")
+    if content and not content.endswith(b"\n"):
+        n_lines += 1
+    return n_lines
+
+
+def compute_unchanged_blocks(
+    curr_file: str,
+    changed_ranges: List[Tuple[int, int, int, int]],
+) -> UnchangedBlocks:
+    """
+    Turn the changed ranges of a file into the blocks that are left unchanged,
+    as (base_starts, curr_starts, sizes) int arrays.
+    """
+    base_starts = array.array("i")
+    curr_starts = array.array("i")
+    sizes = array.array("i")
+    base_offset = 0
+    curr_offset = 0
+    for base_start, base_size, curr_start, curr_size in changed_ranges:
+        size = base_start - base_offset
         if size > 0:
-            start -= 1
-    else:
-        size = 1
-        start = int(range_info) - 1
-    return start, size
+            base_starts.append(base_offset)
+            curr_starts.append(curr_offset)
+            sizes.append(size)
+        base_offset = base_start + base_size
+        curr_offset = curr_start + curr_size
+    size = 0
+    try:
+        size = count_lines(pathlib.Path(curr_file).read_bytes()) - curr_offset
+    except (FileNotFoundError, IsADirectoryError):
+        # Deleted files and submodules have no lines in the working tree
+        pass
+    base_starts.append(base_offset)
+    curr_starts.append(curr_offset)
+    sizes.append(size)
+    return base_starts, curr_starts, sizes
+
+
+def unchanged_blocks_cache_file(base_branch: str) -> pathlib.Path:
+    """
+    Return the path of the disk cache of `unchanged_blocks` for the current state of
+    the working tree. The key depends on the base revision and on the paths and stats
+    of the files that differ from it, so any edit of a changed file invalidates it.
+    """
+    # A range of revisions resolves to several lines, all of which go in the key
+    git_dir, *base_shas = subprocess.check_output(
+        ["git", "rev-parse", "--git-dir", base_branch]
+    ).decode("utf-8").splitlines()
+    raw_paths = subprocess.check_output(
+        ["git", "diff", "--name-only", "-z", base_branch]
+    ).split(b"\0")[:-1]
+
+    # Paths are hashed as bytes, since they may not be valid UTF-8
+    hasher = Hasher()
+    hasher.update(CACHE_VERSION)
+    hasher.update(base_shas)
+    for raw_path in raw_paths:
+        try:
+            stat = os.stat(os.fsdecode(raw_path))
+            hasher.update((raw_path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            hasher.update((raw_path, None))
+    return pathlib.Path(git_dir) / "coverage" / "unchanged_blocks" / f"{hasher.hexdigest()}.pkl"
 
 
 @functools.lru_cache(maxsize=None)
-def unchanged_blocks(base_branch) -> Dict[str, List[Tuple[int, int, int]]]:
+def unchanged_blocks(base_branch: Optional[str]) -> Dict[str, UnchangedBlocks]:
     """
     Returns
     -------
-    Dict[str, List[Tuple[int, int, int]]]
+    Dict[str, UnchangedBlocks]
         File -> (base_starts, curr_starts, sizes)
-        unzipped lists that describe blocks that are unchanged between the two branches
+        int arrays that describe blocks that are unchanged between the two branches
+
+    No base branch means no diff to compare against, and no file is reported.
     """
+    if not base_branch:
+        return {}
 
-    # Get the diff output for all files between the curr working tree and the base branch
-    diff_output = subprocess.check_output(
-        ["git", "diff", "--unified=0", base_branch]
-    ).decode("utf-8")
-
-    file_blocks = {}
-    curr_file = None
-    changed_ranges = []
-
-    def compute_unchanged_blocks():
-        blocks = []
-        if curr_file:
-            # Process the previous file
-            base_offset = 0
-            curr_offset = 0
-            for base_start, base_size, curr_start, curr_size in changed_ranges:
-                size = base_start - base_offset
-                if size > 0:
-                    blocks.append(
-                        (
-                            base_offset,
-                            curr_offset,
-                            size,
-                        )
-                    )
-                base_offset = base_start + base_size
-                curr_offset = curr_start + curr_size
-            size = 0
-            if curr_file:
-                try:
-                    curr_file_content = pathlib.Path(curr_file).read_text().splitlines()
-                    size = len(curr_file_content) - curr_offset
-                except (FileNotFoundError, UnicodeDecodeError):
-                    pass
-            blocks.append(
-                (
-                    base_offset,
-                    curr_offset,
-                    size,
+    cache_file = unchanged_blocks_cache_file(base_branch)
+    try:
+        with open(cache_file, "rb") as f:
+            cached_blocks: Dict[str, UnchangedBlocks] = pickle.load(f)
+        return cached_blocks
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    file_blocks = diff_unchanged_blocks(base_branch)
+
+    # Write to a temporary file first so that concurrent runs never read a partial cache,
+    # and only keep the latest entry since older states of the tree are rarely seen again
+    tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "wb") as f:
+            pickle.dump(file_blocks, f)
+        for old_file in cache_file.parent.glob("*.pkl"):
+            try:
+                old_file.unlink()
+            except FileNotFoundError:
+                pass
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            tmp_file.unlink()
+        except OSError:
+            pass
+
+    return file_blocks
+
+
+def diff_unchanged_blocks(base_branch: str) -> Dict[str, UnchangedBlocks]:
+    """
+    Compute the unchanged blocks of `unchanged_blocks` from the git diff between the
+    working tree and `base_branch`.
+    """
+    # Stream the diff output for all files between the curr working tree and the base
+    # branch. The NUL-separated raw section lists the exact paths of the changed files,
+    # and the patch section that follows it gives the changed ranges of each file.
+    # Submodules and external diff drivers are forced back to plain patches, so that
+    # every raw entry gets its own "diff --git" header.
+    diff_args = [
+        "git", "diff", "--unified=0", "--raw", "-z", "--no-color",
+        "--submodule=short", "--no-ext-diff", base_branch,
+    ]
+    file_changes = []
+    with subprocess.Popen(diff_args, stdout=subprocess.PIPE) as git_diff:
+        assert git_diff.stdout is not None
+        diff_lines = iter(git_diff.stdout)
+
+        # The raw section ends with an empty field, right before the first patch line
+        raw_output = b""
+        for line in diff_lines:
+            raw_output += line
+            if b"\0\0" in raw_output:
+                break
+        raw_output, _, first_patch_line = raw_output.partition(b"\0\0")
+
+        # Each raw entry looks like ":<modes> <shas> <status>\0<path>\0", with a second
+        # path for copies and renames, in which case the last one is the current file.
+        # Type changes are shown as a deletion followed by an addition of the same file.
+        patched_files = []
+        raw_fields = iter(raw_output.split(b"\0") if raw_output else ())
+        for raw_info in raw_fields:
+            status = raw_info.split()[-1]
+            raw_path = next(raw_fields)
+            if status[:1] in (b"R", b"C"):
+                raw_path = next(raw_fields)
+            patched_files.extend([os.fsdecode(raw_path)] * (2 if status == b"T" else 1))
+        patched_files.reverse()
+
+        # First pass: collect the changed ranges of every file of the diff, while git
+        # is still writing it. Lines are kept as bytes and dispatched on their first
+        # byte, so that the "+" / "-" content lines, the bulk of the output, are
+        # skipped with two byte compares.
+        changed_ranges = []
+        for line in itertools.chain([first_patch_line], diff_lines):
+            head = line[:1]
+            if head == b"@":
+                # Examples:
+                # @@ -2,0 +3,59 @@
+                # @@ -85 +85 @@ In EDS-NLP, ...
+                hunk_match = HUNK_RE.match(line)
+                assert hunk_match is not None
+                base_start, base_size, curr_start, curr_size = map(
+                    int, hunk_match.groups(b"1")
                 )
-            )
-        file_blocks[curr_file] = tuple(zip(*blocks) if blocks else ([], [], []))
-
-    for line in diff_output.splitlines():
-        if line.startswith("diff --git"):
-            # Set the curr file to the new one
-            compute_unchanged_blocks()
-            curr_file = line.split()[-1].split("/", 1)[1]
-            changed_ranges = []
-        elif line.startswith("@@"):
-            # Examples:
-            # @@ -2,0 +3,59 @@
-            # @@ -85 +85 @@ In EDS-NLP, ...
-            range_diff_info = line.split("@@")[1].strip()
-            base, curr = range_diff_info.split(" ")
-            changed_ranges.append((*parse_range_info(base), *parse_range_info(curr)))
-        elif line.startswith("-"):
-            continue
-        elif line.startswith("+"):
-            continue
-
-    # Process the last file
-    if curr_file:
-        compute_unchanged_blocks()
+                # Ranges of lines are 1-based, except for empty ones that give the line
+                # they follow, and "0,0" stands for the empty side of a new/deleted file.
+                if base_size > 0:
+                    base_start -= 1
+                elif base_start == 0:
+                    base_start = base_size = 1
+                if curr_size > 0:
+                    curr_start -= 1
+                elif curr_start == 0:
+                    curr_start = curr_size = 1
+                changed_ranges.append((base_start, base_size, curr_start, curr_size))
+            elif head == b"d" and line.startswith(b"diff --git"):
+                # Start collecting the ranges of the new file
+                if not patched_files:
+                    raise CoverageException(
+                        f"Couldn't match the patches of 'git diff {base_branch}' to its files"
+                    )
+                curr_file = patched_files.pop()
+                changed_ranges = []
+                file_changes.append((curr_file, changed_ranges))
+
+    if git_diff.returncode:
+        raise subprocess.CalledProcessError(git_diff.returncode, diff_args)
+    if patched_files:
+        raise CoverageException(
+            f"Couldn't match the patches of 'git diff {base_branch}' to its files"
+        )
+
+    # Second pass: compute the unchanged blocks of each file. This mostly waits on
+    # reading the current files, so they are read from several threads.
+    curr_files = [curr_file for curr_file, _ in file_changes]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        all_blocks = executor.map(
+            compute_unchanged_blocks,
+            curr_files,
+            [changed_ranges for _, changed_ranges in file_changes],
+        )
+        file_blocks = dict(zip(curr_files, all_blocks))
 
     return file_blocks
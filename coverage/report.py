@@ -8,7 +8,8 @@ from __future__ import annotations
 import hashlib
 import os
 import sys
-from typing import IO, TYPE_CHECKING, Any, Iterable, List, Optional, Tuple
+from operator import itemgetter
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 
 from coverage.diff import unchanged_blocks
 from coverage.exceptions import ConfigError, NoDataError
@@ -45,6 +46,9 @@ class SummaryReporter:
         if self.output_format not in {"text", "markdown", "total", "diff"}:
             raise ConfigError(f"Unknown report format choice: {self.output_format!r}")
         self.fr_analysis: List[Tuple[FileReporter, Analysis]] = []
+        self.diff_ids: Dict[str, str] = {}
+        # Snippets of the diff format link to the files of this GitHub pull request
+        self.github_pr_number = os.environ.get("GITHUB_PR_NUMBER")
         self.skipped_count = 0
         self.empty_count = 0
         self.total = Numbers(precision=self.config.precision)
@@ -75,9 +79,10 @@ class SummaryReporter:
 
         """
         # Prepare the formatting strings, header, and column sorting.
+        cover_idx = header.index("Cover")
         max_name = max([len(line[0]) for line in lines_values] + [5]) + 1
-        max_n = max(len(total_line[header.index("Cover")]) + 2, len(" Cover")) + 1
-        max_n = max([max_n] + [len(line[header.index("Cover")]) + 2 for line in lines_values])
+        max_n = max(len(total_line[cover_idx]) + 2, len(" Cover")) + 1
+        max_n = max([max_n] + [len(line[cover_idx]) + 2 for line in lines_values])
         formats = {
             "Name": "{:{name_len}}",
             "Stmts": "{:>7}",
@@ -100,28 +105,22 @@ class SummaryReporter:
         self.write(rule)
 
         formats.update(dict(Cover="{:>{n}}%"), Missing="   {:9}")
+        row_format = "".join(formats[item] for item in header)
+        # Missing, when shown, is the last column
+        has_missing = header[-1] == "Missing"
+        n_values = len(header) - has_missing
         for values in lines_values:
             # build string with line values
-            line_items = [
-                formats[item].format(
-                    str(value)
-                    if item != "Missing"
-                    else ", ".join(format_range(r) for r in value),
-                    name_len=max_name, n=max_n - 1) for item, value in
-                zip(header, values)
-
-            ]
-            self.write_items(line_items)
+            items = [str(value) for value in values[:n_values]]
+            if has_missing:
+                items.append(", ".join(format_range(r) for r in values[n_values]))
+            self.write(row_format.format(*items, name_len=max_name, n=max_n - 1))
 
         # Write a TOTAL line
         if lines_values:
             self.write(rule)
 
-        line_items = [
-            formats[item].format(str(value),
-            name_len=max_name, n=max_n-1) for item, value in zip(header, total_line)
-        ]
-        self.write_items(line_items)
+        self.write(row_format.format(*map(str, total_line), name_len=max_name, n=max_n - 1))
 
         for end_line in end_lines:
             self.write(end_line)
@@ -170,18 +169,17 @@ class SummaryReporter:
         self.write(header_str)
         self.write(rule_str)
 
+        formats.update(dict(Cover="{:>{n}}% |"))
+        row_format = "".join("{}" if item == "Missing" else formats[item] for item in header)
+        # Missing, when shown, is the last column
+        has_missing = header[-1] == "Missing"
+        n_values = len(header) - has_missing
         for values in lines_values:
             # build string with line values
-            formats.update(dict(Cover="{:>{n}}% |"))
-            line_items = [
-                formats[item].format(
-                    str(value).replace("_", "\\_"), name_len=max_name, n=max_n - 1
-                )
-                if item != "Missing"
-                else ", ".join(format_range(r) for r in value)
-                for item, value in zip(header, values)
-            ]
-            self.write_items(line_items)
+            items = [str(value).replace("_", "\\_") for value in values[:n_values]]
+            if has_missing:
+                items.append(", ".join(format_range(r) for r in values[n_values]))
+            self.write(row_format.format(*items, name_len=max_name, n=max_n - 1))
 
         # Write the TOTAL line
         formats.update(dict(Name="|{:>{name_len}} |", Cover="{:>{n}} |"))
@@ -193,7 +191,7 @@ class SummaryReporter:
                 insert = f" **{value}%**"
             else:
                 insert = f" **{value}**"
-            total_line_items += formats[item].format(insert, name_len=max_name, n=max_n)
+            total_line_items.append(formats[item].format(insert, name_len=max_name, n=max_n))
         self.write_items(total_line_items)
         for end_line in end_lines:
             self.write(end_line)
@@ -204,7 +202,6 @@ class SummaryReporter:
         lines_values: list[list[Any]],
         total_line: Optional[list[Any]],
         end_lines: list[str],
-        short: bool = False,
     ) -> None:
         """Internal method that prints report data in markdown format.
 
@@ -222,20 +219,33 @@ class SummaryReporter:
         ]
         header_str = "<tr>{}</tr>".format("".join(header_items))
 
-        lines = []
-        collapsed_lines = []
+        # Each row is kept as its parts, so that it can be rendered again without
+        # the snippet bodies if the report is too large.
+        rows: List[Tuple[bool, str, Optional[List[Tuple[str, str]]], str]] = []
+        # Only the Missing column is compared to the base revision
+        file_blocks = unchanged_blocks(self.config.base_revision) if "Missing" in header else {}
 
         for values in lines_values:
             fr: FileReporter = values[-1]
             # build string with line values
             fields = dict(zip(header, values))
             filename = fields["Name"]
-            source = fr.source().splitlines()
 
             collapse = fields.get("∆ Miss", 0) <= 0
+            snippets = None
             if "Missing" in fields:
                 collapse = all(m.get("same_cov") for m in fields["Missing"])
-                changed_file = filename in unchanged_blocks(self.config.base_revision)
+                changed_file = filename in file_blocks
+
+                # Only read the source when there are snippets to show
+                source = fr.source().splitlines() if fields["Missing"] else []
+
+                # Links to the PR diff only depend on the file
+                link_prefix = None
+                if self.github_pr_number is not None and changed_file:
+                    link_prefix = (
+                        f"{self.github_pr_number}/files#diff-{self.diff_ids[filename]}R"
+                    )
 
                 snippets = []
                 for m in fields["Missing"]:
@@ -244,7 +254,6 @@ class SummaryReporter:
                     nice_range = f"{start}-{end}" if start != end - 1 else str(start)
 
                     # Snippet header
-                    diff_id = hashlib.sha256(filename.encode()).hexdigest()
                     many = 's' if '-' in nice_range else ''
                     if "same_cov" not in m:
                         loc = f"Missing coverage at line{many} {nice_range}"
@@ -252,74 +261,49 @@ class SummaryReporter:
                         loc = f"Was already missing at line{many} {nice_range}"
                     else:
                         loc = f"New missing coverage at line{many} {nice_range} !"
-                    if "GITHUB_PR_NUMBER" in os.environ and changed_file:
-                        link = os.environ.get(
-                            "GITHUB_PR_NUMBER", "."
-                        ) + "/files#diff-{}R{}-R{}".format(diff_id, start, end)
-                        loc = f'<a href="{link}">' + loc + "</a>"
-                    snippet = loc
+                    if link_prefix is not None:
+                        loc = f'<a href="{link_prefix}{start}-R{end}">' + loc + "</a>"
 
                     # Snippet body
-                    if not short:
-                        snippet_lines = []
-                        for i in range(
-                            max(0, start - 1),
-                            min(end + 1, len(source)),
-                        ):
-                            is_missing = start <= i < end
-                            snippet_line = ("- " if is_missing else " ") + source[i]
-                            if not snippet_line.strip():
-                                snippet_line = "<span/>"
-                            snippet_lines.append(snippet_line)
-
-                        snippet_body = "\n".join(snippet_lines)
-                        limit = 256 if collapse else 512 if m.get("same_cov") else 1024
-
-                        if len(snippet_body) > limit:
-                            snippet_body = "\n".join([
-                                s[:128] + "..." if len(s) > 128 else s
-                                for s in
-                                (
-                                    *snippet_lines[:limit // 128],
-                                    "  ...",
-                                    *snippet_lines[-limit // 128:],
-                                )
-                            ])
-
-                        snippet += f'<pre lang="diff">{snippet_body}</pre>'
-
-                    snippets.append(snippet)
-
-                if short:
-                    snippets = ["<li>" + s + "</li>" for s in snippets]
-                body = "".join(snippets)
-                fields["Name"] = (
-                    f"<details>"
-                    f"<summary>{fields['Name']}</summary>"
-                    f"<p>{body}</p>"
-                    f"</details>"
-                )
-
-            line_items = [
-                (
-                    f"<td align={'left' if key == 'Name' else 'right'}>"
-                    f"{value}"
-                    f"{'%' if key == 'Cover' else ''}"
-                    f"</td>"
-                )
+                    snippet_lines = []
+                    for i in range(
+                        max(0, start - 1),
+                        min(end + 1, len(source)),
+                    ):
+                        is_missing = start <= i < end
+                        snippet_line = ("- " if is_missing else " ") + source[i]
+                        if not snippet_line.strip():
+                            snippet_line = "<span/>"
+                        snippet_lines.append(snippet_line)
+
+                    snippet_body = "\n".join(snippet_lines)
+                    limit = 256 if collapse else 512 if m.get("same_cov") else 1024
+
+                    if len(snippet_body) > limit:
+                        snippet_body = "\n".join([
+                            s[:128] + "..." if len(s) > 128 else s
+                            for s in
+                            (
+                                *snippet_lines[:limit // 128],
+                                "  ...",
+                                *snippet_lines[-limit // 128:],
+                            )
+                        ])
+
+                    snippets.append((loc, f'<pre lang="diff">{snippet_body}</pre>'))
+
+            # Name is always the first column
+            cells = "".join(
+                f"<td align=right>{value}{'%' if key == 'Cover' else ''}</td>"
                 for key, value in fields.items()
-                if key != "Missing"
-            ]
-            line = f"<tr>{''.join(line_items)}</tr>"
-
-            if not collapse:
-                lines.append(line)
-            else:
-                collapsed_lines.append(line)
+                if key not in ("Name", "Missing")
+            )
+            rows.append((collapse, filename, snippets, cells))
 
-        # Write the TOTAL line
+        # Prepare the TOTAL line
+        total_row = None
         if total_line:
-            total_line_items: str = ""
+            total_line_items: List[str] = []
             values = dict(zip(header, total_line))
             for item, value in values.items():
                 if item == "Missing":
@@ -331,38 +315,60 @@ class SummaryReporter:
                 else:
                     insert = f"<b>{value}</b>"
                 side = "left" if item == "Name" else "right"
-                total_line_items += f"<td align={side}>{insert}</td>"
-            lines.append(f"<tr>{total_line_items}</tr>")
-        result = (
-            f"<table>"
-            f"<thead>{header_str}</thead>"
-            f"<tbody>{''.join(lines)}</tbody>"
-            f"</table>"
-        )
+                total_line_items.append(f"<td align={side}>{insert}</td>")
+            total_row = f"<tr>{''.join(total_line_items)}</tr>"
+
+        def render(short: bool) -> str:
+            """Assemble the tables, listing only the snippet headers if `short`."""
+            lines = []
+            collapsed_lines = []
+            for collapse, filename, snippets, cells in rows:
+                name = filename
+                if snippets is not None:
+                    if short:
+                        body = "".join(f"<li>{loc}</li>" for loc, _ in snippets)
+                    else:
+                        body = "".join(loc + snippet_body for loc, snippet_body in snippets)
+                    name = (
+                        f"<details>"
+                        f"<summary>{filename}</summary>"
+                        f"<p>{body}</p>"
+                        f"</details>"
+                    )
+                line = f"<tr><td align=left>{name}</td>{cells}</tr>"
+
+                if not collapse:
+                    lines.append(line)
+                else:
+                    collapsed_lines.append(line)
 
-        if collapsed_lines:
-            result += (
-                "\n\n<details><summary>"
-                "Files without new missing coverage"
-                "</summary>\n"
+            if total_row is not None:
+                lines.append(total_row)
+            result = (
                 f"<table>"
                 f"<thead>{header_str}</thead>"
-                f"<tbody>{''.join(collapsed_lines)}</tbody>"
+                f"<tbody>{''.join(lines)}</tbody>"
                 f"</table>"
-                "</details>"
             )
 
-        if not short and len(result) > 65536 - 1024:
-            self._report_diff(
-                header,
-                lines_values,
-                total_line,
-                end_lines,
-                short=True)
-            self.write("\n\n*Snippets were omitted because the report was too large*")
-            return
-        else:
-            self.write(result)
+            if collapsed_lines:
+                result += (
+                    "\n\n<details><summary>"
+                    "Files without new missing coverage"
+                    "</summary>\n"
+                    f"<table>"
+                    f"<thead>{header_str}</thead>"
+                    f"<tbody>{''.join(collapsed_lines)}</tbody>"
+                    f"</table>"
+                    "</details>"
+                )
+            return result
+
+        result = render(short=False)
+        too_large = len(result) > 65536 - 1024
+        if too_large:
+            result = render(short=True)
+        self.write(result)
 
         if end_lines:
             self.write("")
@@ -371,6 +377,9 @@ class SummaryReporter:
 
         self.write("")
 
+        if too_large:
+            self.write("\n\n*Snippets were omitted because the report was too large*")
+
     def report(
         self, morfs: Optional[Iterable[TMorf]], outfile: Optional[IO[str]] = None
     ) -> float:
@@ -409,17 +418,22 @@ class SummaryReporter:
         if self.config.show_missing:
             header += ["Missing"]
 
+        sort_columns = {
+            "name": "Name",
+            "stmts": "Stmts",
+            "miss": "Miss",
+            "cover": "Cover",
+            "diff": "∆ Miss",
+            "branch": "Branch",
+            "brpart": "BrPart",
+        }
+        # map the sort options to the indices of their columns, if they exist
+        header_idx = {item: idx for idx, item in enumerate(header)}
         column_order = {
-            "name": header.index("Name") if "Name" in header else None,
-            "stmts": header.index("Stmts") if "Stmts" in header else None,
-            "miss": header.index("Miss") if "Miss" in header else None,
-            "cover": header.index("Cover") if "Cover" in header else None,
-            "diff": header.index("∆ Miss") if "∆ Miss" in header else None,
-            "branch": header.index("Branch") if "Branch" in header else None,
-            "brpart": header.index("BrPart") if "BrPart" in header else None,
+            option: header_idx[item]
+            for option, item in sort_columns.items()
+            if item in header_idx
         }
-        # filter if exist
-        column_order = {k: v for k, v in column_order.items() if v is not None}
 
         # `lines_values` is list of lists of sortable values.
         lines_values = []
@@ -453,10 +467,7 @@ class SummaryReporter:
         if sort_option == "name":
             lines_values = human_sorted_items(lines_values, reverse=reverse)
         else:
-            lines_values.sort(
-                key=lambda line: (line[sort_idx], line[0]),     # type: ignore[index]
-                reverse=reverse,
-            )
+            lines_values.sort(key=itemgetter(sort_idx, 0), reverse=reverse)
 
         # Calculate total if we had at least one file.
         total_line = ["TOTAL", self.total.n_statements, self.total.n_missing]
@@ -502,3 +513,7 @@ class SummaryReporter:
             self.empty_count += 1
         else:
             self.fr_analysis.append((fr, analysis))
+            if self.output_format == "diff" and self.github_pr_number is not None:
+                # GitHub anchors the files of a PR diff with the sha256 of their path
+                filename = fr.relative_filename()
+                self.diff_ids[filename] = hashlib.sha256(filename.encode()).hexdigest()
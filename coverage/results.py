@@ -8,7 +8,7 @@ from __future__ import annotations
 import bisect
 import collections
 
-from typing import Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
 
 from coverage.debug import AutoReprMixin
 from coverage.diff import unchanged_blocks
@@ -108,14 +108,10 @@ class Analysis:
             unchanged = unchanged_blocks(self.base_revision).get(filename)
             if unchanged is not None:
                 unchanged_base_lines, unchanged_curr_lines, sizes = unchanged
-                unchanged_lines = {
-                    start + i
-                    for start, size in zip(unchanged_curr_lines, sizes)
-                    for i in range(size)
-                }
-
                 for m in missing:
-                    m["same_code"] = set(range(m["start"], m["end"])) <= unchanged_lines
+                    m["same_code"] = _in_blocks(
+                        unchanged_curr_lines, sizes, m["start"], m["end"]
+                    )
             else:
                 for m in missing:
                     m["same_code"] = True
@@ -396,6 +392,21 @@ def _line_ranges(
     return pairs
 
 
+def _in_blocks(
+    starts: Sequence[int],
+    sizes: Sequence[int],
+    start: int,
+    end: int,
+) -> bool:
+    """Are all the lines from `start` to `end` (excluded) in the sorted `starts`/`sizes` blocks?"""
+    while start < end:
+        idx = bisect.bisect_right(starts, start) - 1
+        if idx < 0 or starts[idx] + sizes[idx] <= start:
+            return False
+        start = starts[idx] + sizes[idx]
+    return True
+
+
 def format_lines(
     statements: Iterable[TLineNo],
     lines: Iterable[TLineNo],
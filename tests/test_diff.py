@@ -0,0 +1,149 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/nedbat/coveragepy/blob/master/NOTICE.txt
+
+"""Tests for coverage.diff"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+from typing import Any, Dict
+from unittest import mock
+
+import pytest
+
+from coverage.diff import count_lines, diff_unchanged_blocks, unchanged_blocks
+from coverage.diff import unchanged_blocks_cache_file
+
+from tests.coveragetest import CoverageTest
+
+
+class UnchangedBlocksTest(CoverageTest):
+    """Tests of `unchanged_blocks`."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        unchanged_blocks.cache_clear()
+        self.git("init", "-q")
+        self.make_file("f.txt", "a\nb\nc\nd\n")
+        self.make_file("same.txt", "same\n")
+        self.make_file("gone.txt", "gone\n")
+        self.git("add", ".")
+        self.git("commit", "-q", "-m", "base")
+
+    def git(self, *args: str) -> None:
+        """Run a git command in the temp directory."""
+        subprocess.run(
+            ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+            check=True,
+        )
+
+    def assert_blocks(self, blocks: Dict[str, Any], expected: Dict[str, Any]) -> None:
+        """Assert that the columns of `blocks` have the `expected` values."""
+        assert {f: tuple(map(tuple, columns)) for f, columns in blocks.items()} == expected
+
+    def test_modified_file(self) -> None:
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {"f.txt": ((0, 2, 4), (0, 2, 5), (1, 2, 0))})
+
+    def test_non_utf8_content(self) -> None:
+        self.make_file("f.txt", bytes=b"a\n\xe9\nc\nd\ne\n")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {"f.txt": ((0, 2, 4), (0, 2, 5), (1, 2, 0))})
+
+    def test_non_utf8_path(self) -> None:
+        non_utf8_path = os.fsdecode(b"caf\xe9.txt")
+        self.make_file(non_utf8_path, "a\n")
+        self.git("add", ".")
+        self.git("commit", "-q", "-m", "non utf8 path")
+        self.make_file(non_utf8_path, "a\nb\n")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {non_utf8_path: ((0, 1), (0, 2), (1, 0))})
+
+    def test_deleted_file(self) -> None:
+        os.remove("gone.txt")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {"gone.txt": ((1,), (2,), (0,))})
+
+    def test_no_changes(self) -> None:
+        assert unchanged_blocks("HEAD") == {}
+
+    def test_revision_range(self) -> None:
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        assert unchanged_blocks("HEAD~0..HEAD") == {}
+
+    def test_no_base_branch(self) -> None:
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        assert unchanged_blocks(None) == {}
+
+    def test_unknown_revision(self) -> None:
+        with pytest.raises(subprocess.CalledProcessError):
+            diff_unchanged_blocks("no-such-branch")
+
+    def test_submodule_log(self) -> None:
+        # With diff.submodule=log, git shows a submodule change without any patch
+        os.mkdir("m")
+        self.git("-C", "m", "init", "-q")
+        self.git("-C", "m", "commit", "-q", "--allow-empty", "-m", "sub 1")
+        self.make_file("z.txt", "z\n")
+        self.git("add", ".")
+        self.git("commit", "-q", "-m", "submodule")
+        self.git("-C", "m", "commit", "-q", "--allow-empty", "-m", "sub 2")
+        self.git("config", "diff.submodule", "log")
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        self.make_file("z.txt", "z\ny\n")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {
+            "f.txt": ((0, 2, 4), (0, 2, 5), (1, 2, 0)),
+            "m": ((1,), (1,), (0,)),
+            "z.txt": ((0, 1), (0, 2), (1, 0)),
+        })
+
+    def test_renamed_file_with_spaces(self) -> None:
+        self.git("mv", "f.txt", "with space.txt")
+        self.make_file("with space.txt", "a\nB\nc\nd\ne\n")
+        blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {"with space.txt": ((0, 2, 4), (0, 2, 5), (1, 2, 0))})
+
+    def test_disk_cache(self) -> None:
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        blocks = unchanged_blocks("HEAD")
+        assert os.path.exists(unchanged_blocks_cache_file("HEAD"))
+
+        # A new process reuses the blocks stored on disk
+        unchanged_blocks.cache_clear()
+        with mock.patch("coverage.diff.diff_unchanged_blocks") as mock_diff:
+            assert unchanged_blocks("HEAD") == blocks
+        mock_diff.assert_not_called()
+
+        # Editing a changed file invalidates the cache
+        unchanged_blocks.cache_clear()
+        self.make_file("f.txt", "a\nB\nc\n")
+        self.assert_blocks(unchanged_blocks("HEAD"), {"f.txt": ((0, 2, 4), (0, 2, 3), (1, 1, 0))})
+
+        # Only the latest entry is kept
+        cache_dir = os.path.dirname(unchanged_blocks_cache_file("HEAD"))
+        assert os.listdir(cache_dir) == [os.path.basename(unchanged_blocks_cache_file("HEAD"))]
+
+
+    def test_disk_cache_write_error(self) -> None:
+        # A failed write leaves no partial file behind
+        self.make_file("f.txt", "a\nB\nc\nd\ne\n")
+        with mock.patch("coverage.diff.pickle.dump", side_effect=OSError("disk full")):
+            blocks = unchanged_blocks("HEAD")
+        self.assert_blocks(blocks, {"f.txt": ((0, 2, 4), (0, 2, 5), (1, 2, 0))})
+        assert os.listdir(os.path.dirname(unchanged_blocks_cache_file("HEAD"))) == []
+
+
+class CountLinesTest(CoverageTest):
+    """Tests of `count_lines`."""
+
+    run_in_temp_dir = False
+
+    def test_count_lines(self) -> None:
+        assert count_lines(b"") == 0
+        assert count_lines(b"\n") == 1
+        assert count_lines(b"a\nb\n") == 2
+        assert count_lines(b"a\nb") == 2
+        assert count_lines(b"a\r\nb\rc\n") == 2
@@ -14,6 +14,7 @@ import py_compile
 import re
 
 from typing import Tuple
+from unittest import mock
 
 import pytest
 
@@ -902,6 +903,52 @@ class SummaryTest(UsingModulesMixin, CoverageTest):
         assert self.get_report(cov, output_format="total", precision=2) == "78.57\n"
         assert self.get_report(cov, output_format="total", precision=4) == "78.5714\n"
 
+    def test_diff_with_missing(self) -> None:
+        self.make_file("mymissing.py", """\
+            def missing(x, y):
+                if x:
+                    print("x")
+                    return x
+                return y
+            missing(0, 1)
+            """)
+        cov = coverage.Coverage(source=["."])
+        self.start_import_stop(cov, "mymissing")
+        report = self.get_report(cov, squeeze=False, output_format="diff", show_missing=True)
+
+        assert "<summary>mymissing.py</summary>" in report
+        assert (
+            'Missing coverage at lines 2-4<pre lang="diff">     if x:\n'
+            + '-         print("x")\n-         return x\n     return y</pre>'
+        ) in report
+        assert "Snippets were omitted" not in report
+
+    def test_diff_without_missing(self) -> None:
+        self.make_file("mymissing.py", """\
+            def missing(x):
+                return x
+            """)
+        cov = coverage.Coverage(source=["."], base_revision="HEAD")
+        self.start_import_stop(cov, "mymissing")
+        with mock.patch("coverage.report.unchanged_blocks") as mock_unchanged_blocks:
+            report = self.get_report(cov, squeeze=False, output_format="diff")
+
+        mock_unchanged_blocks.assert_not_called()
+        assert "<td align=left>mymissing.py</td>" in report
+        assert "<summary>mymissing.py</summary>" not in report
+
+    def test_diff_too_large(self) -> None:
+        self.make_file("toolarge.py", "".join(
+            f"def f{i}():\n    return '{'x' * 200}'\n" for i in range(300)
+        ))
+        cov = coverage.Coverage(source=["."])
+        self.start_import_stop(cov, "toolarge")
+        report = self.get_report(cov, squeeze=False, output_format="diff", show_missing=True)
+
+        assert "<li>Missing coverage at line 1</li>" in report
+        assert "<pre" not in report
+        assert report.endswith("\n\n\n*Snippets were omitted because the report was too large*\n")
+
     def test_bug_1524(self) -> None:
         self.make_file("bug1524.py", """\
             class Mine:
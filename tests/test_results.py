@@ -12,7 +12,7 @@ from typing import Dict, Iterable, List, Tuple, cast
 import pytest
 
 from coverage.exceptions import ConfigError
-from coverage.results import format_lines, Numbers, should_fail_under
+from coverage.results import _in_blocks, format_lines, Numbers, should_fail_under
 from coverage.types import TLineNo
 
 from tests.coveragetest import CoverageTest
@@ -169,3 +169,16 @@ def test_format_lines_with_arcs(
     result: str,
 ) -> None:
     assert format_lines(statements, lines, arcs) == result
+
+
+@pytest.mark.parametrize("start, end, result", [
+    (0, 0, True),
+    (0, 2, True),
+    (2, 3, False),
+    (4, 9, True),
+    (5, 10, False),
+    (8, 10, False),
+])
+def test_in_blocks(start: int, end: int, result: bool) -> None:
+    # Blocks 0-2, 3-6 and 6-9, the last two being contiguous.
+    assert _in_blocks([0, 3, 6], [2, 3, 3], start, end) == result